@@ -1,7 +1,28 @@
+import io
+import os
 import sys
+import hashlib
 import argparse
+import pandas as pd
 import glikoz
 
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "glikoz")
+# bump whenever the parsed DataFrame changes, so that old caches are ignored
+CACHE_VERSION = "1"
+# number of parsed backups kept in CACHE_DIR
+CACHE_SIZE = 10
+# characters of the backup hashed at a time
+CHUNK_SIZE = 1 << 16
+
+
+def min_date(value):
+    """argparse type for YYYY-MM-DD dates"""
+    try:
+        return glikoz.dataframe_handler.parse_min_date(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid date: {value!r} (expected YYYY-MM-DD)")
+
 
 def get_args():
     parser = argparse.ArgumentParser(prog="get_report",
@@ -9,17 +30,75 @@ def get_args():
 
     parser.add_argument("--format", type=str, help="Report format",
                         required=True, choices=["json", "raw", "pdf"])
+    parser.add_argument("--since", type=min_date, default=None,
+                        help="Ignore entries before this date (YYYY-MM-DD)")
+    parser.add_argument("--cache", action="store_true",
+                        help=f"Cache the parsed CSV in {CACHE_DIR}")
     parser.add_argument("--verbose", action="store_true", help="Verbose")
 
     return parser.parse_args()
 
 
+def cache_key(csv, min_date=None):
+    """SHA-256 (hex) of the backup contents, min_date and the versions that
+    the cached DataFrame depends on
+
+    The backup is hashed in chunks as it is read, never as a whole"""
+    key = hashlib.sha256(
+        f"{CACHE_VERSION};{pd.__version__};{min_date};".encode())
+    for chunk in iter(lambda: csv.read(CHUNK_SIZE), ""):
+        key.update(chunk.encode())
+    return key.hexdigest()
+
+
+def prune_cache():
+    """Remove all but the CACHE_SIZE most recently used cached DataFrames"""
+    paths = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)
+             if name.endswith(".pkl")]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[CACHE_SIZE:]:
+        os.remove(path)
+
+
+def parse_csv(csv, min_date=None, use_cache=False):
+    """Parse a Diaguard CSV backup into its entry DataFrame
+
+    If use_cache is set, parsed DataFrames are cached in CACHE_DIR, keyed by
+    cache_key, so an unchanged backup is only parsed once. Only the CACHE_SIZE
+    most recently used backups are kept, and unreadable cached files are
+    ignored (and replaced). The backup is read twice (hashed, then parsed), so
+    it is only held in memory if it cannot be rewound (e.g. a pipe)"""
+    if not use_cache:
+        return glikoz.DiaguardCSVParser().parse_csv(csv, min_date=min_date)
+    if not csv.seekable():
+        csv = io.StringIO(csv.read())
+    start = csv.tell()
+    cache_path = os.path.join(CACHE_DIR, f"{cache_key(csv, min_date)}.pkl")
+    csv.seek(start)
+    if os.path.exists(cache_path):
+        try:
+            df = pd.read_pickle(cache_path)
+        except Exception:
+            # truncated, corrupt or otherwise unreadable: parse it again
+            pass
+        else:
+            os.utime(cache_path)  # most recently used
+            return df
+    df = glikoz.DiaguardCSVParser().parse_csv(csv, min_date=min_date)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # written under a temporary name so readers never see a partial file
+    df.to_pickle(cache_path + ".tmp")
+    os.replace(cache_path + ".tmp", cache_path)
+    prune_cache()
+    return df
+
+
 def get_report(args=None):
     if args is None:
         args = get_args()
 
     csv = sys.stdin
-    df = glikoz.DiaguardCSVParser().parse_csv(csv)
+    df = parse_csv(csv, min_date=args.since, use_cache=args.cache)
     df_handler = glikoz.DataFrameHandler(df)
 
     if args.format == "json":
@@ -28,6 +107,9 @@ def get_report(args=None):
     elif args.format == "pdf":
         output = open("output.pdf", "wb")
         reporter = glikoz.PDFReportCreator(df_handler)
+    elif args.format == "raw":
+        output = sys.stdout
+        reporter = glikoz.RawReportCreator(df_handler)
 
     reporter.fill_report()
     reporter.create_report(output)
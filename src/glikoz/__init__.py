@@ -1,2 +1,3 @@
 from .dataframe_handler import DiaguardCSVParser, DataFrameHandler
-from .report_creator import JSONReportCreator, PDFReportCreator
\ No newline at end of file
+from .report_creator import (JSONReportCreator, PDFReportCreator,
+                             RawReportCreator)
@@ -1,8 +1,27 @@
 import datetime
-import re
+from csv import reader as csv_reader
+import numpy as np
 import pandas as pd
 from typing import TextIO, List
 
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+MIN_DATE_FORMAT = "%Y-%m-%d"
+ENTRY_FIELDS = ("measurement", "foodEaten", "entryTag")
+HOUR_DTYPE = pd.CategoricalDtype(categories=range(24))
+ENTRY_COLUMNS = ["date", "glucose", "bolus_insulin", "correction_insulin",
+                 "basal_insulin", "activity", "hba1c", "carbs", "tags",
+                 "comments"]
+
+
+def parse_min_date(min_date: str = None) -> str:
+    """Validate a YYYY-MM-DD date, returning it zero-padded (or None)
+
+    A ValueError is raised if min_date is not a valid date"""
+    if min_date is None:
+        return None
+    date = datetime.datetime.strptime(min_date, MIN_DATE_FORMAT)
+    return date.strftime(MIN_DATE_FORMAT)
+
 
 class DiaguardCSVParser:
     """Parses a Diaguard CSV backup file into a DataFrame
@@ -17,68 +36,113 @@ class DiaguardCSVParser:
     - total_insulin: sum of fast_insulin and basal_insulin
     - activity: physical activity (minutes)
     - hba1c: hba1c (percentage)
-    - meal: dictionary describing carbohydrates (g) consumed per food eaten
-    - carbs: sum of consumed carbohydrates (g) in meal
+    - carbs: sum of consumed carbohydrates (g) in the entry
+    - meal (only if keep_meal is set): dictionary describing carbohydrates
+    (g) consumed per food eaten
     - tags: list of strings that tag the entry
     - comments: string providing considerations on the recorded entry
+    (categorical, as most entries share the same few values)
     """
 
-    def __init__(self):
+    def __init__(self, keep_meal: bool = False):
         self.foods = {}
-        self.entries = []
+        self.keep_meal = keep_meal
+        self.columns = ENTRY_COLUMNS + (["meal"] if keep_meal else [])
+        self.entries = {column: [] for column in self.columns}
+        # one item per foodEaten line: index of its entry, food name, grams
+        self.food_events = {"entry": [], "food": [], "weight": []}
 
-    def parse_csv(self, csv: TextIO) -> pd.DataFrame:
+    def parse_csv(self, csv: TextIO, min_date: str = None) -> pd.DataFrame:
         """Reads a Diaguard backup CSV file and creates its entry DataFrame
 
+        Arguments:
+        - min_date: if provided (format YYYY-MM-DD), entries dated before it
+        are skipped while reading and never reach the DataFrame. A ValueError
+        is raised if it is not a valid date
+
         Attributes created:
         - foods: a dictionary of edibles present in entries. Its keys
         are food names (strings)
-        - entries: a list of dictionaries describing dataframe rows (it is
-        later used in constructing the dataframe itself)
-        - csv_lines: a list of preprocessed lines from the CSV backup
+        - entries: a dictionary of equal-length lists, one per dataframe
+        column (it is later used in constructing the dataframe itself)
+        - food_events: a dictionary of equal-length lists describing every
+        food eaten in the entries (used in computing their carbs)
+
+        The backup is streamed: each line is split into its semicolon
+        separated (and unquoted) values and processed as it is read, so the
+        file is never held in memory as a whole
         """
-        raw_lines = csv.readlines()
-        self.csv_lines = [self.format_line(ln.strip()) for ln in raw_lines]
-        self.process_lines()
-        if len(self.entries) > 0:
+        self.min_date = parse_min_date(min_date)
+        rows = csv_reader(csv, delimiter=";", quotechar='"')
+        self.process_lines((row[0], row[1:]) for row in rows if row)
+        if len(self.entries["date"]) > 0:
             self.init_df()
         else:
-            self.df = pd.DataFrame(columns=[
-                "date", "glucose", "bolus_insulin", "correction_insulin",
-                "basal_insulin", "activity", "hba1c", "meal", "tags",
-                "comments", "carbs", "fast_insulin", "total_insulin"
+            self.df = pd.DataFrame(columns=self.columns + [
+                "fast_insulin", "total_insulin"
             ])
         return self.df
 
     def init_df(self):
         """Initialize the entry DataFrame, sorted by ascending date
 
-        The DataFrame is created from the entries list and derived columns"""
-        self.df = pd.DataFrame(self.entries)
-        self.df["date"] = pd.to_datetime(self.df["date"])
-        self.df["fast_insulin"] = (self.df["bolus_insulin"]
-                                   + self.df["correction_insulin"])
-        self.df["total_insulin"] = (self.df["fast_insulin"]
-                                    + self.df["basal_insulin"])
-        self.df["carbs"] = self.df["meal"].apply(lambda m: sum(m.values()))
-        self.df.sort_values(by="date", ascending=True, inplace=True)
-
-    def format_line(self, line):
-        """
-        Remove double quotes and semicolons from a line and split it into a
-        list of semicolon-separated values
-        """
-        def clear_chars(s): return re.sub(r"^\"|\"$", '', s)
-        line = list(map(clear_chars, line.split(';')))
-        return line[0], line[1:]
+        The DataFrame is created from the entries columns and derived columns.
+        Measurement values are kept as raw strings while parsing and only
+        converted here, one whole column at a time. All columns are converted
+        and derived before the DataFrame is built, so that pandas lays each
+        dtype out as a single block of contiguous columns"""
+        columns = dict(self.entries)
+        columns["date"] = pd.to_datetime(columns["date"], format=DATE_FORMAT,
+                                         cache=True)
+        # numbers are stored in the narrowest dtype that safely holds them
+        # (float32 where readings may be missing)
+        columns["glucose"] = np.trunc(pd.to_numeric(columns["glucose"])
+                                      ).astype(np.float32)
+        for column in ["bolus_insulin", "correction_insulin",
+                       "basal_insulin", "activity"]:
+            columns[column] = pd.to_numeric(columns[column]
+                                            ).astype(np.int16)
+        columns["hba1c"] = pd.to_numeric(columns["hba1c"]).astype(np.float32)
+        columns["carbs"] = self.compute_carbs(columns["carbs"])
+        # mostly empty strings and a few repeated messages
+        columns["comments"] = pd.Categorical(columns["comments"])
+        columns["fast_insulin"] = (columns["bolus_insulin"]
+                                   + columns["correction_insulin"])
+        columns["total_insulin"] = (columns["fast_insulin"]
+                                    + columns["basal_insulin"])
+        self.df = pd.DataFrame(columns)
+        self.df.sort_values(by="date", ascending=True, inplace=True,
+                            ignore_index=True)
+
+    def compute_carbs(self, meal_carbs):
+        """Add the carbohydrates of every food eaten to each entry's meal
+
+        Food carbohydrates are computed for all foodEaten lines at once, as
+        grams eaten times the food's carbohydrates per 100g. If a food is
+        eaten more than once in the same entry, only its last line counts
+        (in both carbs and meal)"""
+        carbs = np.array(meal_carbs, dtype=np.float64)
+        if len(self.food_events["entry"]) > 0:
+            events = pd.DataFrame(self.food_events).drop_duplicates(
+                subset=["entry", "food"], keep="last")
+            ratio = events["food"].map(pd.Series(self.foods, dtype=float))
+            events["carbs"] = pd.to_numeric(events["weight"]) * ratio/100
+            food_carbs = events.groupby("entry")["carbs"].sum()
+            carbs[food_carbs.index] += food_carbs.to_numpy()
+            if self.keep_meal:
+                meals = self.entries["meal"]
+                for entry, food, food_carbs in zip(
+                        events["entry"], events["food"], events["carbs"]):
+                    meals[entry][food] = food_carbs
+        return carbs.astype(np.float32)
 
     def process_food(self, food_info):
         """Format food name and save its glycemic index to foods dictionary"""
         food_name = food_info[0].lower()
         self.foods[food_name] = float(food_info[-1])
 
-    def process_entry(self, content, i):
-        """Process a single entry that starts in the i-th line in csv_lines
+    def process_entry(self, content, lines):
+        """Process a single entry whose fields are the next items in lines
 
         An entry consists of many lines that describe some or all of the
         following information:
@@ -93,69 +157,113 @@ class DiaguardCSVParser:
         - foodEaten: food consumed (its name and grams are provided)
         - entryTag (string): tag that describes the entry
 
-        The end of valid field names indicates the end of an entry.
+        Each field is dispatched to its handler in _FIELD_HANDLERS, which
+        updates the entry being read. The end of valid field names (those
+        without a handler) indicates the end of an entry. The line
+        that ended it (None if lines is exhausted) is returned, so that the
+        caller processes it next.
         """
         date, comments = content[:2]
         try:
-            datetime.datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
+            datetime.datetime.strptime(date, DATE_FORMAT)
         except ValueError:
-            return i+1
-        glucose, activity, hba1c = None, 0, None
-        insulin = (0,)*3  # bolus, correction, basal
-        meal = {}
-        tags = []
-        while i < len(self.csv_lines):
-            field, values = self.csv_lines[i]
-            if field == "measurement":
-                category = values[0]
-                if category == "bloodsugar":
-                    glucose = int(float(values[1]))
-                elif category == "insulin":
-                    insulin = tuple(map(lambda x: int(float(x)), values[1:4]))
-                elif category == "meal":
-                    meal["carbs"] = float(values[1])
-                elif category == "activity":
-                    activity = int(float(values[1]))
-                elif category == "hba1c":
-                    hba1c = float(values[1])
-            elif field == "foodEaten":
-                food_eaten = values[0].lower()
-                food_weight = float(values[1])
-                if food_eaten not in self.foods:
-                    self.foods[food_eaten] = 0
-                carb_ratio = self.foods[food_eaten]/100
-                meal[food_eaten] = food_weight * carb_ratio
-            elif field == "entryTag":
-                tags.append(values[0])
-            else:
+            return next(lines, None)
+        if self.min_date is not None and date < self.min_date:
+            # dates are zero-padded, so string order is chronological order
+            line = next(lines, None)
+            while line is not None and line[0] in ENTRY_FIELDS:
+                line = next(lines, None)
+            return line
+        entry = {"glucose": None, "insulin": (0,)*3, "activity": 0,
+                 "hba1c": None, "meal_carbs": 0.0,
+                 "meal": {} if self.keep_meal else None, "tags": []}
+        line = next(lines, None)
+        while line is not None:
+            field, values = line
+            handler = self._FIELD_HANDLERS.get(field)
+            if handler is None:
                 break
-            i += 1
-        self.entries.append({
-            "date": date,
-            "glucose": glucose,
-            "bolus_insulin": insulin[0],
-            "correction_insulin": insulin[1],
-            "basal_insulin": insulin[2],
-            "activity": activity,
-            "hba1c": hba1c,
-            "meal": meal,
-            "tags": tags,
-            "comments": comments,
-        })
-        return i
-
-    def process_lines(self):
-        """Process the CSV backup lines sequentially"""
-        i = 0
-        while i < len(self.csv_lines):
-            name, line_content = self.csv_lines[i]
+            handler(self, entry, values)
+            line = next(lines, None)
+        entries = self.entries
+        entries["date"].append(date)
+        entries["glucose"].append(entry["glucose"])
+        bolus, correction, basal = entry["insulin"]
+        entries["bolus_insulin"].append(bolus)
+        entries["correction_insulin"].append(correction)
+        entries["basal_insulin"].append(basal)
+        entries["activity"].append(entry["activity"])
+        entries["hba1c"].append(entry["hba1c"])
+        # foods eaten are added to the meal in compute_carbs
+        entries["carbs"].append(entry["meal_carbs"])
+        if self.keep_meal:
+            entries["meal"].append(entry["meal"])
+        entries["tags"].append(entry["tags"])
+        entries["comments"].append(comments)
+        return line
+
+    def _set_glucose(self, entry, values):
+        entry["glucose"] = values[1]
+
+    def _set_insulin(self, entry, values):
+        entry["insulin"] = tuple(values[1:4])  # bolus, correction, basal
+
+    def _set_meal(self, entry, values):
+        entry["meal_carbs"] = float(values[1])
+        if entry["meal"] is not None:
+            entry["meal"]["carbs"] = entry["meal_carbs"]
+
+    def _set_activity(self, entry, values):
+        entry["activity"] = values[1]
+
+    def _set_hba1c(self, entry, values):
+        entry["hba1c"] = values[1]
+
+    _MEASUREMENT_HANDLERS = {
+        "bloodsugar": _set_glucose,
+        "insulin": _set_insulin,
+        "meal": _set_meal,
+        "activity": _set_activity,
+        "hba1c": _set_hba1c,
+    }
+
+    def _handle_measurement(self, entry, values):
+        handler = self._MEASUREMENT_HANDLERS.get(values[0])
+        if handler is not None:
+            handler(self, entry, values)
+
+    def _handle_food(self, entry, values):
+        food_eaten = values[0].lower()
+        if food_eaten not in self.foods:
+            self.foods[food_eaten] = 0
+        food_events = self.food_events
+        # the entry is appended to entries once all its lines are read
+        food_events["entry"].append(len(self.entries["date"]))
+        food_events["food"].append(food_eaten)
+        food_events["weight"].append(values[1])
+
+    def _handle_tag(self, entry, values):
+        entry["tags"].append(values[0])
+
+    # one handler per field in ENTRY_FIELDS
+    _FIELD_HANDLERS = {
+        "measurement": _handle_measurement,
+        "foodEaten": _handle_food,
+        "entryTag": _handle_tag,
+    }
+
+    def process_lines(self, lines):
+        """Process an iterator of formatted CSV backup lines sequentially"""
+        line = next(lines, None)
+        while line is not None:
+            name, line_content = line
             if name == "food":
                 self.process_food(line_content)
-                i = i+1
+                line = next(lines, None)
             elif name == "entry":
-                i = self.process_entry(line_content, i+1)
+                line = self.process_entry(line_content, lines)
             else:
-                i = i+1
+                line = next(lines, None)
 
 
 class DataFrameHandler:
@@ -168,47 +276,140 @@ class DataFrameHandler:
         """Constructs the entry dataframe, sorted by ascending datetime
 
         Two versions of the dataframe are kept: the original one, and one with
-        filter applied. This allows users to use the reset_df function
+        filter applied. This allows users to use the reset_df function. The
+        original one is indexed by row position and its glucose is float32
         """
+        if not entry_df["date"].is_monotonic_increasing:
+            entry_df = entry_df.sort_values(by="date", kind="stable",
+                                            ignore_index=True)
+        if not entry_df.index.equals(pd.RangeIndex(len(entry_df))):
+            entry_df = entry_df.reset_index(drop=True)
+        glucose = entry_df["glucose"]
+        if (pd.api.types.is_numeric_dtype(glucose)
+                and glucose.dtype != np.float32):
+            entry_df = entry_df.assign(glucose=glucose.astype(np.float32))
         self.original_df = entry_df
-        self.df = self.original_df.copy()
+        # False only if some dates are missing (NaT)
+        self._original_is_sorted = entry_df["date"].is_monotonic_increasing
+        self._column_ranges = {}
+        self._date_keys = {}
+        self.reset_df()
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """Current (filtered) DataFrame, which can be modified without
+        changing original_df"""
+        if self._df_is_view:
+            self._df = self._df.copy()
+            self._df_is_view = False
+        self._df_is_exposed = True
+        return self._df
+
+    @df.setter
+    def df(self, value: pd.DataFrame):
+        self._df = value
+        self._df_is_view = False
+        self._df_is_exposed = True
+        self._df_is_sorted = (value is not None
+                              and value["date"].is_monotonic_increasing)
+
+    def view(self) -> pd.DataFrame:
+        """Current (filtered) DataFrame, which must not be modified"""
+        return self._df
+
+    def _select(self, df: pd.DataFrame, is_slice: bool = False):
+        """Replace the current df with a subset of it chosen by a filter
+
+        Arguments:
+        - is_slice: whether df is a positional slice (a view) of the current
+        df rather than a new DataFrame
+        """
+        self._df_is_view = is_slice and self._df_is_view
+        self._df = df
+
+    def _covers_column(self, column: str, lower_bound, upper_bound) -> bool:
+        """Whether [lower_bound, upper_bound) keeps every row of current df"""
+        if self._df_is_exposed or self.original_df.empty:
+            return False
+        if column not in self._column_ranges:
+            values = self.original_df[column]
+            self._column_ranges[column] = (values.min(), values.max(),
+                                           values.isna().any())
+        col_min, col_max, has_missing = self._column_ranges[column]
+        return (not has_missing and lower_bound <= col_min
+                and upper_bound > col_max)
+
+    def _date_key(self, kind: str) -> pd.Series:
+        """Groupby key of df derived from its date column ("hour", "day" or
+        "weekday")"""
+        if self._df_is_exposed:
+            return self._compute_date_key(self._df["date"], kind)
+        if kind not in self._date_keys:
+            self._date_keys[kind] = self._compute_date_key(
+                self.original_df["date"], kind)
+        key = self._date_keys[kind]
+        if self._df is self.original_df:
+            return key
+        return key.take(self._df.index)
+
+    @staticmethod
+    def _compute_date_key(dates: pd.Series, kind: str) -> pd.Series:
+        dates = pd.to_datetime(dates).dt
+        if kind == "hour":
+            return dates.hour.astype(HOUR_DTYPE)
+        if kind == "day":
+            return dates.normalize()
+        return dates.day_name()
 
     def count(self):
         """Count total number of entries"""
-        return len(self.df)
+        return len(self._df)
+
+    def hour(self) -> pd.Series:
+        """Hour of the day of each entry in df (categorical, 0 to 23)"""
+        return self._date_key("hour")
 
     def groupby_hour(self):
-        """Group df by hour of the day"""
-        return self.df.groupby(self.df["date"].dt.hour)
+        """Group df by hour of the day
+
+        The hour is categorical, so there are always 24 groups (0 to 23), even
+        for hours without entries"""
+        return self._df.groupby(self.hour(), observed=False)
 
     def groupby_day(self):
         """Group df by date without hour"""
-        return self.df.groupby(self.df["date"].dt.date)
+        return self._df.groupby(self._date_key("day"))
 
     def groupby_weekday(self):
         """Group df by day of the week"""
-        return self.df.groupby(self.df["date"].dt.day_name())
+        return self._df.groupby(self._date_key("weekday"))
 
     # filters select data from df and return the handler itself
     # (so you can do handler.glucose(min=70, max=100).carbs(min=5, max=70).df)
     def reset_df(self):
         """Reset current df to original df"""
-        self.df = self.original_df.copy()
+        self._df = self.original_df
+        self._df_is_view = True
+        self._df_is_exposed = False
+        self._df_is_sorted = self._original_is_sorted
         return self
 
     def col_lims(self, column: str, lower_bound: float = 0,
                  upper_bound: float = 9999):
         """Filter by column (numeric) values in [lower_bound, upper_bound)"""
-        self.df = self.df[(self.df[column] >= lower_bound)
-                          & (self.df[column] < upper_bound)]
+        if self._covers_column(column, lower_bound, upper_bound):
+            return self
+        df = self._df
+        mask = (df[column] >= lower_bound) & (df[column] < upper_bound)
+        self._select(df[mask])
         return self
 
     def has_tags(self, invert_filter=False):
         """Select all entries with tags"""
-        mask = self.df["tags"].astype(bool)
+        mask = self._df["tags"].str.len() > 0
         if invert_filter:
             mask = ~mask
-        self.df = self.df[mask]
+        self._select(self._df[mask])
         return self
 
     def tags_include(self, tags: List[str], include_any: bool = False):
@@ -219,33 +420,80 @@ class DataFrameHandler:
         include_any: whether filtering will select entries with just some of
                      the tags
         """
-        selector = any if include_any else all
-        def filter_fn(row): return selector(t in row["tags"] for t in tags)
-
         if type(tags) is str:
             tags = [tags]
-
-        filter_column = self.df.apply(filter_fn, axis=1)
-        self.df = self.df[filter_column]
+        wanted = set(tags)
+        required_matches = 1 if include_any else len(wanted)
+
+        # one (row position, tag) pair per tag, so matching is a vectorized
+        # isin followed by a count of distinct wanted tags per row
+        row_count = len(self._df)
+        exploded = pd.Series(self._df["tags"].to_numpy(),
+                             dtype=object).explode()
+        hits = exploded[exploded.isin(wanted)]
+        matches = hits.groupby(level=0).nunique().reindex(
+            range(row_count), fill_value=0)
+        mask = matches.to_numpy() >= required_matches
+        self._select(self._df[mask])
         return self
 
     def has_comments(self):
         """Select all entries with comments"""
-        self.df = self.df[self.df["comments"].astype(bool)]
+        self._select(self._df[self._df["comments"].str.len() > 0])
         return self
 
     def date(self, lower_bound: str = "1990-01-01",
              upper_bound: str = "2100-01-01"):
         """Filter by date in format YYYY-MM-DD"""
-        self.df = self.df[(self.df["date"] >= lower_bound)
-                          & (self.df["date"] < upper_bound)]
+        lower_bound = pd.Timestamp(lower_bound)
+        upper_bound = pd.Timestamp(upper_bound)
+        if self._df.empty or self._covers_column("date", lower_bound,
+                                                 upper_bound):
+            return self
+        if not self._df_is_sorted:
+            dates = self._df["date"]
+            self._select(self._df[(dates >= lower_bound)
+                                  & (dates < upper_bound)])
+            return self
+        dates = self._df["date"].to_numpy()
+        start, end = np.searchsorted(
+            dates, [lower_bound.to_datetime64(), upper_bound.to_datetime64()])
+        self._select(self._df.iloc[start:end], is_slice=True)
         return self
 
     def last_x_days(self, x: int):
         """Select all entries in the most recent x days"""
-        most_recent_timestamp = pd.to_datetime(self.df["date"].max())
+        df, is_slice = self._last_x_days(x)
+        if df is not self._df:
+            self._select(df, is_slice=is_slice)
+        return self
+
+    def view_last_x_days(self, x: int) -> pd.DataFrame:
+        """Entries of df in the most recent x days, without filtering df
+
+        Like view, the returned DataFrame must not be modified"""
+        return self._last_x_days(x)[0]
+
+    def _last_x_days(self, x: int):
+        """Entries of df in the most recent x days, and whether they are a
+        positional slice of df"""
+        if self._df.empty:
+            return self._df, True
+        dates = self._df["date"].to_numpy()
+        if self._df_is_sorted:
+            most_recent_timestamp = pd.Timestamp(dates[-1])
+        else:
+            most_recent_timestamp = pd.Timestamp(self._df["date"].max())
+        if pd.isna(most_recent_timestamp):
+            # no entry has a date
+            return self._df.iloc[:0], True
         most_recent_day_start = most_recent_timestamp.replace(
             hour=0, minute=0, second=0)
         delta = pd.Timedelta(-(x-1), 'd')
-        self.df = self.df[self.df["date"] >= most_recent_day_start + delta]
-        return self
+        cutoff = most_recent_day_start + delta
+        if self._covers_column("date", cutoff, pd.Timestamp.max):
+            return self._df, True
+        if not self._df_is_sorted:
+            return self._df[self._df["date"] >= cutoff], False
+        start = np.searchsorted(dates, cutoff.to_datetime64())
+        return self._df.iloc[start:], True
@@ -1,13 +1,54 @@
 import json
 
-import datetime as dt
 import numpy as np
-from matplotlib import pyplot as plt
+import pandas as pd
+import matplotlib
 from matplotlib.backends import backend_pdf
-from typing import BinaryIO, TextIO, Final
+from matplotlib.figure import Figure
+from typing import Any, BinaryIO, TextIO, Final
 
 from .dataframe_handler import DataFrameHandler
 
+HOUR_TICKS = list(range(1, 24)) + [0]
+HOUR_LABELS = [f"{h:02d}" for h in HOUR_TICKS]
+# matplotlib settings used while drawing the PDF report (lines are simplified
+# and drawn in chunks, which keeps long glucose series cheap to render)
+PDF_RC_PARAMS = {
+    "path.simplify": True,
+    "path.simplify_threshold": 1.0,
+    "agg.path.chunksize": 10000,
+}
+# headers of the entries table columns
+ENTRIES_DISPLAY_NAMES = {
+    "date": "Date",
+    "glucose": "Glucose (mg/dL)",
+    "bolus_insulin": "Bolus (iu)",
+    "correction_insulin": "Correction (iu)",
+    "basal_insulin": "Basal (iu)",
+    "carbs": "Carbohydrates (g)",
+}
+
+
+def _format_num(column: pd.Series) -> np.ndarray:
+    """Format a numeric column as integer strings, leaving zeros blank"""
+    numbers = column.to_numpy(dtype=np.float64)
+    numbers = np.where(np.isnan(numbers), 0, numbers).astype(np.int64)
+    as_str = numbers.astype(str).astype(object)
+    as_str[numbers == 0] = ''
+    return as_str
+
+
+def _to_builtin(value: Any) -> Any:
+    """Convert numpy values (also inside dicts) to plain Python objects"""
+    if isinstance(value, dict):
+        return {
+            "-".join(map(str, k)) if isinstance(k, tuple) else k:
+            _to_builtin(v) for k, v in value.items()
+        }
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
 
 class ReportCreator:
     """Base report creator class
@@ -25,6 +66,9 @@ class ReportCreator:
         self.df_handler = dataframe_handler
         self.report_as_dict = {}
         self.GRAPH_DAYS = 15
+        self.ENTRIES_DAYS = 5
+        # name -> (DataFrame, value computed from it), see _cached
+        self._cache = {}
 
     def reset_df(self, day_count: int = None):
         """Remove filters from the DataFrame
@@ -34,6 +78,7 @@ class ReportCreator:
         DataFrameHandler's last_x_days function (with x = day_count)
         """
         self.df_handler.reset_df().last_x_days(day_count)
+        self._cache.clear()
 
     def store(self, key: str, value: any):
         """Store value in report, indexed by key"""
@@ -43,13 +88,54 @@ class ReportCreator:
         """Retrieve value from report, or default_value if key missing"""
         return self.report_as_dict.get(key, default_value)
 
+    def _cached(self, name: str, compute):
+        """Get compute(df) for the DataFrameHandler's current DataFrame
+
+        The value is computed once and reused until the DataFrame changes"""
+        df = self.df_handler.view()
+        cached = self._cache.get(name)
+        if cached is None or cached[0] is not df:
+            cached = (df, compute(df))
+            self._cache[name] = cached
+        return cached[1]
+
+    def groupby_day(self):
+        """Group entries by day (see DataFrameHandler.groupby_day)
+
+        The groupby is reused until the DataFrame changes, so the entries are
+        only split into days once for all daily statistics"""
+        return self._cached("groupby_day",
+                            lambda df: self.df_handler.groupby_day())
+
+    def glucose(self) -> np.ndarray:
+        """Get the glucose readings (mg/dL) of the DataFrame, without missing
+        values and sorted in ascending order
+
+        The readings are extracted and sorted once, and reused until the
+        DataFrameHandler's DataFrame changes. Being sorted, the number of
+        readings under any threshold is a binary search away"""
+        def sorted_glucose(df):
+            glucose = df["glucose"].to_numpy(dtype=np.float64)
+            return np.sort(glucose[~np.isnan(glucose)])
+        return self._cached("glucose", sorted_glucose)
+
+    def daily_totals(self) -> pd.DataFrame:
+        """Compute the number of entries, number of glucose readings and fast
+        insulin sum of each day
+
+        All three are aggregated in a single groupby pass, and reused until
+        the DataFrameHandler's DataFrame changes"""
+        return self._cached("daily_totals", lambda df: self.groupby_day().agg(
+            entries=("date", "count"),
+            glucose_entries=("glucose", "count"),
+            fast_insulin=("fast_insulin", "sum")))
+
     def save_hba1c(self):
         """
         Compute and store HbA1c value based on glucose readings of most recent
         90 days
 
-        This function filters the DataFrame to the most recent 90 days, but it
-        is the user's responsibility to undo this filter if necessary.
+        The DataFrameHandler is left unfiltered.
 
         The HbA1c estimative depends on the estimated average glucose (mg/dL)
         from the last three months, as described in the paper "Translating the
@@ -57,8 +143,7 @@ class ReportCreator:
         Kuenen J, Borg R, Zheng H, Schoenfeld D, and Heine RJ (2008) (Diabetes
         Care. 31 (8): 1473-78).
         """
-        self.df_handler.last_x_days(90)
-        glucose = self.df_handler.df["glucose"].dropna()
+        glucose = self.df_handler.view_last_x_days(90)["glucose"].dropna()
         if glucose.empty:
             hba1c = None
         else:
@@ -71,30 +156,28 @@ class ReportCreator:
         The time in range is the number of entries in the intervals [lo, up),
         (, lo) and [up,) (i.e., in range, below range, and above range)
         """
-        glucose = self.df_handler.df["glucose"].dropna()
-        in_range = glucose[(glucose >= lower_bound)
-                           & (glucose < upper_bound)].count()
-        below_range = glucose[glucose < lower_bound].count()
-        above_range = glucose[glucose >= upper_bound].count()
+        glucose = self.glucose()
+        below_range, below_upper = np.searchsorted(
+            glucose, [lower_bound, upper_bound])
+        in_range = below_upper - below_range
+        above_range = len(glucose) - below_upper
         self.store("time_in_range", in_range)
         self.store("time_below_range", below_range)
         self.store("time_above_range", above_range)
 
     def save_entry_count(self):
         """Compute and store total and mean daily number of entries"""
-        if self.df_handler.df.empty:
-            entry_count = 0
-            mean_daily_entry_count = 0.
+        if self.df_handler.view().empty:
+            entry_count = glucose_entry_count = 0
+            mean_daily_entry_count = mean_daily_glucose_entry_count = 0.
         else:
             entry_count = self.df_handler.count()
-            glucose_entry_count = self.df_handler.df["glucose"].dropna(
-                ).count()
-            dates_grouped_by_day = self.df_handler.groupby_day()["date"]
-            glucose_grouped_by_day = (self.df_handler.groupby_day()
-                                      )["glucose"]
-            mean_daily_entry_count = dates_grouped_by_day.count().mean()
-            mean_daily_glucose_entry_count = glucose_grouped_by_day.count(
-                ).mean()
+            # count() already skips missing values, no need to drop them
+            glucose_entry_count = self.df_handler.view()["glucose"].count()
+            daily_totals = self.daily_totals()
+            mean_daily_entry_count = daily_totals["entries"].mean()
+            mean_daily_glucose_entry_count = daily_totals["glucose_entries"
+                                                          ].mean()
         self.store("entry_count", entry_count)
         self.store("glucose_entry_count", glucose_entry_count)
         self.store("mean_daily_entry_count", mean_daily_entry_count)
@@ -103,21 +186,24 @@ class ReportCreator:
 
     def save_fast_insulin_use(self):
         """Compute and store daily fast insulin use (mean and std dev)"""
-        if self.df_handler.df.empty:
+        if self.df_handler.view().empty:
             mean_daily_fast_insulin = 0.
             std_daily_fast_insulin = 0.
         else:
-            groupby = self.df_handler.groupby_day()
-            fast_insulin_sum = groupby["fast_insulin"].sum()
-            mean_daily_fast_insulin = fast_insulin_sum.mean()
-            std_daily_fast_insulin = fast_insulin_sum.std()
+            mean_daily_fast_insulin, std_daily_fast_insulin = (
+                self.daily_totals()["fast_insulin"].agg(["mean", "std"]))
         self.store("mean_daily_fast_insulin", mean_daily_fast_insulin)
         self.store("std_daily_fast_insulin", std_daily_fast_insulin)
 
     def save_mean_glucose_by_hour(self):
         """Compute and store mean and std dev of glucose by hour"""
-        df = self.df_handler.df[["date", "glucose"]].dropna()
-        if df.empty:
+        glucose = self.df_handler.view()["glucose"].to_numpy(
+            dtype=np.float64)
+        # the handler's (cached) hour key, as category codes 0 to 23
+        # (-1 where the date is missing)
+        hour = self.df_handler.hour().cat.codes.to_numpy(dtype=np.int64)
+        is_valid = ~np.isnan(glucose) & (hour >= 0)
+        if not is_valid.any():
             glucose_by_hour_series = {
                 "mean_glucose": np.array([]),
                 "hour": np.array([]),
@@ -125,16 +211,22 @@ class ReportCreator:
                 "min_glucose": np.array([]),
             }
         else:
-            glucose_by_hour = df.groupby(df["date"].dt.hour)
-            mean_glucose = glucose_by_hour.mean().fillna(0)["glucose"]
-            max_glucose = glucose_by_hour.max().fillna(0)["glucose"]
-            min_glucose = glucose_by_hour.min().fillna(0)["glucose"]
-            hour = list(glucose_by_hour.groups.keys())
+            # reduce the readings of each hour into 24 fixed bins, instead of
+            # building a hash-based groupby
+            hour = hour[is_valid]
+            glucose = glucose[is_valid]
+            counts = np.bincount(hour, minlength=24)
+            sums = np.bincount(hour, weights=glucose, minlength=24)
+            max_glucose = np.full(24, -np.inf)
+            np.maximum.at(max_glucose, hour, glucose)
+            min_glucose = np.full(24, np.inf)
+            np.minimum.at(min_glucose, hour, glucose)
+            has_readings = counts > 0
             glucose_by_hour_series = {
-                "mean_glucose": mean_glucose.values,
-                "hour": np.array(hour),
-                "max_glucose": max_glucose.values,
-                "min_glucose": min_glucose.values
+                "mean_glucose": sums[has_readings] / counts[has_readings],
+                "hour": np.flatnonzero(has_readings),
+                "max_glucose": max_glucose[has_readings],
+                "min_glucose": min_glucose[has_readings]
             }
         self.store("glucose_by_hour_series", glucose_by_hour_series)
 
@@ -143,25 +235,21 @@ class ReportCreator:
         time_above_range_by_hour = np.array([0]*24)
         time_below_range_by_hour = np.array([0]*24)
         time_in_range_by_hour = np.array([0]*24)
-        if not self.df_handler.df.empty:
-            # return self.df.groupby(self.df["date"].dt.hour)
-            glucose = self.df_handler.df["glucose"].dropna()
-            groupby_param = self.df_handler.df["date"].dt.hour
-            time_above_range_by_hour_count = glucose[glucose >= upper_bound
-                                                     ].groupby(groupby_param
-                                                               ).count()
-            for hour, count in time_above_range_by_hour_count.iteritems():
-                time_above_range_by_hour[hour] = count
-            time_below_range_by_hour_count = glucose[glucose < lower_bound
-                                                     ].groupby(groupby_param
-                                                               ).count()
-            for hour, count in time_below_range_by_hour_count.iteritems():
-                time_below_range_by_hour[hour] = count
-            time_in_range_by_hour_count = glucose[
-                (glucose >= lower_bound) & (glucose < upper_bound)
-                ].groupby(groupby_param).count()
-            for hour, count in time_in_range_by_hour_count.iteritems():
-                time_in_range_by_hour[hour] = count
+        if not self.df_handler.view().empty:
+            df = self.df_handler.view()
+            glucose = df["glucose"].to_numpy(dtype=np.float64)
+            # the handler's (cached) hour key, as category codes 0 to 23
+            # (-1 where the date is missing)
+            hour = self.df_handler.hour().cat.codes.to_numpy(dtype=np.int64)
+            is_valid = ~np.isnan(glucose) & (hour >= 0)
+            hour = hour[is_valid]
+            # 0, 1 and 2 are below, in and above range; each (hour, range)
+            # pair gets its own bin so all 72 are counted in one pass
+            tir_bin = np.digitize(glucose[is_valid],
+                                  [lower_bound, upper_bound])
+            counts = np.bincount(3*hour + tir_bin, minlength=72)
+            (time_below_range_by_hour, time_in_range_by_hour,
+             time_above_range_by_hour) = counts.reshape(24, 3).T
         self.store("time_above_range_by_hour", time_above_range_by_hour)
         self.store("time_below_range_by_hour", time_below_range_by_hour)
         self.store("time_in_range_by_hour", time_in_range_by_hour)
@@ -184,11 +272,12 @@ class ReportCreator:
         """
         low_count = 0
         distributions = {idx: 0 for idx in distribution_indexes}
-        if not self.df_handler.df.empty:
-            glucose = self.df_handler.df["glucose"].dropna()
-            low_count = (glucose < threshold).sum()
+        if not self.df_handler.view().empty:
+            glucose = self.glucose()
+            low_count = np.searchsorted(glucose, threshold)
             for a, b in distributions:
-                count = ((glucose >= a) & (glucose <= b)).sum()
+                count = (np.searchsorted(glucose, b, side="right")
+                         - np.searchsorted(glucose, a))
                 distributions[(a, b)] = count
         self.store("low_bg_count", low_count)
         self.store("low_bg_distributions", distributions)
@@ -199,58 +288,57 @@ class ReportCreator:
         That is, the mean (across days) rate of entries with low
         blood sugars"""
         mean_daily_low_rate = 0.
-        daily_low_rate_sum = 0.
-        daily_low_rate_count = 0
-        if not self.df_handler.df.empty:
-            groupby = self.df_handler.groupby_day()
-            for _, group in groupby:
-                glucose = group["glucose"].dropna()
-                total = glucose.count()
-                low = (glucose < threshold).sum()
-                if total > 0:
-                    daily_low_rate_sum += low/total
-                daily_low_rate_count += 1
-            mean_daily_low_rate = daily_low_rate_sum / daily_low_rate_count
+        if not self.df_handler.view().empty:
+            # number of the day of each entry, to count lows and readings of
+            # all days at once (days without readings have a rate of 0)
+            groupby = self.groupby_day()
+            day = groupby.ngroup().to_numpy(dtype=np.float64)
+            glucose = self.df_handler.view()["glucose"].to_numpy(
+                dtype=np.float64)
+            # entries without a date have no day (NaN or -1)
+            has_day = day >= 0
+            day = day[has_day].astype(np.int64)
+            glucose = glucose[has_day]
+            total = np.bincount(day, weights=~np.isnan(glucose),
+                                minlength=groupby.ngroups)
+            low = np.bincount(day, weights=glucose < threshold,
+                              minlength=groupby.ngroups)
+            daily_low_rate = np.divide(low, total, out=np.zeros_like(low),
+                                       where=total > 0)
+            if daily_low_rate.size > 0:
+                mean_daily_low_rate = daily_low_rate.mean()
         self.store("mean_daily_low_rate", mean_daily_low_rate)
 
     def save_very_low_count_and_rate(self, threshold=55):
         """Compute and store very low glucose count and rate"""
         very_low_count = 0
         very_low_rate = 0.
-        if not self.df_handler.df.empty:
-            glucose = self.df_handler.df["glucose"].dropna()
-            total = glucose.count()
-            very_low_count = (glucose < threshold).sum()
-            very_low_rate = very_low_count/total
+        if not self.df_handler.view().empty:
+            glucose = self.glucose()
+            total = glucose.size
+            very_low_count = np.searchsorted(glucose, threshold)
+            if total > 0:
+                very_low_rate = very_low_count/total
         self.store("very_low_bg_count", very_low_count)
         self.store("very_low_bg_rate", very_low_rate)
 
     def save_entries_df(self):
-        """Compute and store DataFrame of all entries"""
-        def meal_to_str(meal): return "; ".join(
-                [f"{x}, {meal[x]:.1f}g" for x in meal.keys()])
-
-        def epoch_to_datetime(e): return e.strftime("%d/%m/%y %H:%M")
-
-        columns_display_names = {
-            "date": "Date",
-            "glucose": "Glucose",
-            "bolus_insulin": "Bolus",
-            "correction_insulin": "Correction",
-            "basal_insulin": "Basal",
-            # "meal": "Meal",
-            "carbs": "Carbohydrates",
+        """Compute and store the table of all entries
+
+        The table is a dictionary of equal-length arrays of strings (one per
+        column, in display order), built straight from the DataFrame columns
+        without an intermediate DataFrame"""
+        src = self.df_handler.view()
+        table = {
+            "date": pd.to_datetime(src["date"]).dt.strftime(
+                "%d/%m/%y %H:%M").to_numpy(),
+            "glucose": _format_num(src["glucose"]),
+            "bolus_insulin": _format_num(src["bolus_insulin"]),
+            "correction_insulin": _format_num(src["correction_insulin"]),
+            "basal_insulin": _format_num(src["basal_insulin"]),
+            "carbs": _format_num(src["carbs"]),
         }
-        number_columns = ["glucose", "carbs", "bolus_insulin",
-                          "correction_insulin", "basal_insulin"]
-
-        df = self.df_handler.df[list(columns_display_names.keys())].copy()
-        # df["meal"] = df["meal"].apply(meal_to_str)
-        df["date"] = df["date"].apply(epoch_to_datetime)
-        for c in number_columns:
-            df[c] = df[c].fillna(0).apply(
-                lambda x: f"{int(x)}" if x != 0 else '')
-        self.store("entries_dataframe", df)
+        self.store("entries_dataframe", table)
 
     def fill_report(self):
         """Compute and store all information to be reported"""
@@ -263,7 +351,8 @@ class ReportCreator:
         self.save_tir_by_hour()
         self.save_low_counts()
         self.save_mean_daily_low_rate()
-        self.reset_df(5)
+        self.save_very_low_count_and_rate()
+        self.reset_df(self.ENTRIES_DAYS)
         self.save_entries_df()
 
     def create_report(self):
@@ -274,25 +363,65 @@ class ReportCreator:
 class JSONReportCreator(ReportCreator):
     """ReportCreator for JSON files"""
 
+    def _to_json(self) -> dict:
+        """Copy of the report made of plain Python objects only
+
+        numpy scalars and arrays are converted in bulk (with tolist) and
+        tuple keys, such as the ranges of the low distributions, are
+        written as "a-b" strings"""
+        report = {key: _to_builtin(value)
+                  for key, value in self.report_as_dict.items()}
+        # glucose by hour is reported in whole mg/dL
+        report["glucose_by_hour_series"] = {
+            series: np.asarray(values).astype(int).tolist()
+            for series, values in self.retrieve(
+                "glucose_by_hour_series").items()
+        }
+        return report
+
     def create_report(self, target: TextIO):
-        """Dump base report dict into target JSON file"""
-        entries_df = self.retrieve("entries_dataframe")
-        self.store("entries_dataframe", entries_df.to_json())
-        glucose_by_hour_series = self.retrieve("glucose_by_hour_series")
-        for series in glucose_by_hour_series.keys():
-            as_list = list(glucose_by_hour_series[series])
-            as_python_int = map(int, as_list)
-            glucose_by_hour_series[series] = list(as_python_int)
-        self.store("glucose_by_hour_series", glucose_by_hour_series)
-        for tir_variant in ["in", "above", "below"]:
-            key = f"time_{tir_variant}_range_by_hour"
-            value = self.retrieve(key)
-            self.store(key, list(map(int, list(value))))
-        for key, value in self.report_as_dict.items():
-            if value is not None and np.issubdtype(type(value), np.number):
-                self.report_as_dict[key] = int(value)
-        print(self.report_as_dict)
-        json.dump(self.report_as_dict, target)
+        """Dump base report dict into target JSON file
+
+        fill_report is only called here if the report is still empty"""
+        if not self.report_as_dict:
+            self.fill_report()
+        json.dump(self._to_json(), target, ensure_ascii=False)
+
+
+class RawReportCreator(ReportCreator):
+    """ReportCreator for plain text (e.g. to be printed on a terminal)"""
+
+    def create_report(self, target: TextIO):
+        """Write the report as plain text into target
+
+        The text is assembled in memory and written at once, with one
+        tab-separated line per row of the entries table"""
+        if not self.report_as_dict:
+            self.fill_report()
+        hba1c = self.retrieve("hba1c")
+        hba1c_as_str = "N/A" if hba1c is None else f"{hba1c:.2f}%"
+        fast_per_day = self.retrieve("mean_daily_fast_insulin")
+        std_fast_per_day = self.retrieve("std_daily_fast_insulin")
+        lines = [
+            f"Report for the last {self.GRAPH_DAYS} days",
+            f"HbA1c (last 3 months): {hba1c_as_str}",
+            (f"Total entries: {self.retrieve('entry_count')},"
+             + f" per day: {self.retrieve('mean_daily_entry_count'):.2f}"),
+            f"Fast insulin/day: {fast_per_day:.2f} ± {std_fast_per_day:.2f}",
+            (f"Time in range: {self.retrieve('time_in_range')},"
+             + f" below range: {self.retrieve('time_below_range')},"
+             + f" above range: {self.retrieve('time_above_range')}"),
+            (f"Hypoglycemia episodes: {self.retrieve('low_bg_count')},"
+             + " very low (below 55):"
+             + f" {self.retrieve('very_low_bg_count')}"),
+            "",
+            f"Entries in the last {self.ENTRIES_DAYS} days",
+        ]
+        entries = self.retrieve("entries_dataframe")
+        lines.append("\t".join(ENTRIES_DISPLAY_NAMES[column]
+                               for column in entries))
+        lines.extend("\t".join(row) for row in zip(*entries.values()))
+        target.write("\n".join(lines) + "\n")
 
 
 class PDFReportCreator(ReportCreator):
@@ -302,63 +431,64 @@ class PDFReportCreator(ReportCreator):
         super().__init__(dataframe_handler)
         self.A5_FIGURE_SIZE: Final = (8.27, 5.83)
         self.PAGE_SIZE: Final = self.A5_FIGURE_SIZE
+        self.ENTRIES_DAYS = 7
 
     def write_statistics_page(self, show_hba1c: bool = True):
         """Write basic statistics such as Time in Range and HbA1c"""
-        fig = plt.figure(figsize=self.PAGE_SIZE)
-        plt.subplot2grid((2, 1), (0, 0))
+        fig = Figure(figsize=self.PAGE_SIZE)
+        ax = fig.add_subplot(2, 1, 1)
 
-        plt.text(0, 1, f"Report for the last {self.GRAPH_DAYS} days",
-                 ha="left", va="top", fontsize=34)
-        plt.text(0, .7, "Statistics", ha="left", va="top", fontsize=28)
+        ax.text(0, 1, f"Report for the last {self.GRAPH_DAYS} days",
+                ha="left", va="top", fontsize=34)
+        ax.text(0, .7, "Statistics", ha="left", va="top", fontsize=28)
         if show_hba1c:
             hba1c_value = self.retrieve("hba1c")
             if hba1c_value is None:
                 hba1c_as_str = "N/A"
             else:
                 hba1c_as_str = f"{hba1c_value:.2f}"
-            plt.text(0, 0.5, f"HbA1c (last 3 months): {hba1c_as_str}%",
-                     ha="left", va="top")
+            ax.text(0, 0.5, f"HbA1c (last 3 months): {hba1c_as_str}%",
+                    ha="left", va="top")
         entry_count = self.retrieve("entry_count")
         mean_daily_entry_count = self.retrieve("mean_daily_entry_count")
-        plt.text(
+        ax.text(
             0, 0.4,
             (f"Total entries: {entry_count},"
              + f" per day: {mean_daily_entry_count:.2f}"),
             ha="left", va="top")
         fast_per_day = self.retrieve("mean_daily_fast_insulin")
         std_fast_per_day = self.retrieve("std_daily_fast_insulin")
-        plt.text(
+        ax.text(
             0, 0.3,
             f"Fast insulin/day: {fast_per_day:.2f} ± {std_fast_per_day:.2f}",
             ha="left", va="top")
-        sizes = [self.retrieve("time_above_range"),
-                 self.retrieve("time_below_range"),
-                 self.retrieve("time_in_range")]
-        total = sum(sizes)
-        plt.axis("off")
+        sizes = np.array([self.retrieve("time_above_range"),
+                          self.retrieve("time_below_range"),
+                          self.retrieve("time_in_range")], dtype=np.float64)
+        total = sizes.sum()
+        ax.axis("off")
 
         # time in range pie chart
-        plt.text(.5, 0, "Time in Range", ha="center", va="bottom", fontsize=16)
+        ax.text(.5, 0, "Time in Range", ha="center", va="bottom", fontsize=16)
 
-        plt.subplot2grid((2, 1), (1, 0), aspect="equal")
+        ax = fig.add_subplot(2, 1, 2, aspect="equal")
 
         labels = ["Above range", "Below range", "In range"]
         if total == 0:
-            plt.text(.7, 0, "Time in Range graph not available", ha="center",
-                     va="bottom", fontsize=14)
+            ax.text(.7, 0, "Time in Range graph not available", ha="center",
+                    va="bottom", fontsize=14)
         else:
-            percentages = list(map(lambda x: f"{100*x/total:.2f}%", sizes))
+            percentages = [f"{p:.2f}%" for p in 100*sizes/total]
 
             colors = ["tab:red", "tab:blue", "tab:olive"]
 
-            plt.pie(sizes, labels=percentages, colors=colors)
-            plt.legend(labels, loc="best", bbox_to_anchor=(1, 0, 1, 1))
+            ax.pie(sizes, labels=percentages, colors=colors)
+            ax.legend(labels, loc="best", bbox_to_anchor=(1, 0, 1, 1))
         self.pdf.savefig(fig)
 
     def plot_glucose_by_hour_graph(self):
         """Plot a mean glucose by hour line graph"""
-        fig = plt.figure(figsize=self.PAGE_SIZE)
+        fig = Figure(figsize=self.PAGE_SIZE)
         ax = fig.add_subplot(1, 1, 1)
 
         series_dict = self.retrieve("glucose_by_hour_series")
@@ -366,8 +496,6 @@ class PDFReportCreator(ReportCreator):
         glucose = series_dict["mean_glucose"]
         mx_err = series_dict["max_glucose"] - glucose
         mn_err = glucose - series_dict["min_glucose"]
-        mn_glucose = min(series_dict["min_glucose"])
-        mx_glucose = max(series_dict["max_glucose"])
 
         ax.errorbar(hour, glucose, yerr=[mn_err, mx_err], fmt="-o",
                     capsize=3, elinewidth=2, capthick=2, color="royalblue",
@@ -378,52 +506,37 @@ class PDFReportCreator(ReportCreator):
         ax.set_xlabel("Hour")
         ax.set_ylabel("Glucose (mg/dL)")
 
-        all_hours = list(range(1, 24)) + [0]
-        ax.set_xticks(all_hours)
-        ax.set_xticklabels(list(map(lambda h: f"{h:0=2d}", all_hours)))
-        for h in all_hours:
-            ax.axvline(h, color="gray", linestyle="--", linewidth=.5)
+        ax.set_xticks(HOUR_TICKS)
+        ax.set_xticklabels(HOUR_LABELS)
 
-        glucose_lo = 25*(np.floor(mn_glucose/25))
-        glucose_hi = 25*(np.floor(mx_glucose/25)+1)
-        glucose_ticks = list(range(int(glucose_lo), int(glucose_hi), 25))
-        ax.set_yticks(glucose_ticks)
-        for t in ax.get_yticks():
-            ax.axhline(t, color="gray", linestyle="--", linewidth=.5)
+        if len(hour) > 0:
+            mn_glucose = series_dict["min_glucose"].min()
+            mx_glucose = series_dict["max_glucose"].max()
+            glucose_lo = 25*(np.floor(mn_glucose/25))
+            glucose_hi = 25*(np.floor(mx_glucose/25)+1)
+            ax.set_yticks(np.arange(int(glucose_lo), int(glucose_hi), 25))
+        ax.grid(True, color="gray", linestyle="--", linewidth=.5)
 
         self.pdf.savefig(fig)
 
     def plot_daily_glucose_graph(self, data):
         """Plot a glucose graph for a day in the entires DataFrame"""
-        fig = plt.figure(figsize=self.PAGE_SIZE)
+        fig = Figure(figsize=self.PAGE_SIZE)
         ax = fig.add_subplot(1, 1, 1)
 
         ax.set_title("Glucose by Hour")
         ax.set_xlabel("Time")
         ax.set_ylabel("Glucose (mg/dL)")
 
-        time, glucose = list(data[:, 0]), data[:, 1]
-        to_remove = [i for i in range(len(glucose)) if glucose[i] == '']
-        to_remove.reverse()
-        for i in to_remove:
-            glucose = np.delete(glucose, i)
-            time.pop(i)
-        time = np.array(list(map(
-            lambda s: dt.datetime.strptime(s, "%d/%m/%y %H:%M").time(), time)))
-        glucose = glucose.astype(np.dtype("int64"))
+        # entries without a glucose reading have it blank
+        has_glucose = data[:, 1] != ''
+        time = pd.to_datetime(data[has_glucose, 0],
+                              format="%d/%m/%y %H:%M").time
+        glucose = data[has_glucose, 1].astype(np.dtype("int64"))
         ax.plot(time, glucose)
 
-        """
-        all_hours = list(range(1, 24)) + [0]
-        ax.set_xticks(all_hours)
-        ax.set_xticklabels(list(map(lambda h: f"{h:0=2d}", all_hours)))
-        for h in all_hours:
-            ax.axvline(h, color="gray", linestyle="--", linewidth=.5)
-        """
-
         glucose_lo = min(glucose)
         glucose_hi = max(glucose)
-        print(glucose)
         glucose_ticks = list(range(int(glucose_lo), int(glucose_hi), 25))
         ax.set_yticks(glucose_ticks)
         for t in ax.get_yticks():
@@ -431,26 +544,24 @@ class PDFReportCreator(ReportCreator):
 
         self.pdf.savefig(fig)
 
-    def write_entries_table(self, data):
-        """Plot the table for a day in the entries DataFrame"""
-        columns_display_names = {
-            "date": "Date",
-            "glucose": "Glucose (mg/dL)",
-            "bolus_insulin": "Bolus (iu)",
-            "correction_insulin": "Correction (iu)",
-            "basal_insulin": "Basal (iu)",
-            "carbs": "Carbohydrates (g)",
-            "bolus_insulin": "Bolus (iu)",
-            "correction_insulin": "Correction (iu)",
-            "basal_insulin": "Basal (iu)",
-            "carbs": "Carbohydrates (g)",
-        }
-        columns = list(map(lambda x: columns_display_names.get(x),
-                           self.retrieve("entries_dataframe").keys()))
+    def write_entries_table(self, data, fig: Figure = None):
+        """Plot the table for a day in the entries table
+
+        Arguments:
+        - fig: if provided, the table is drawn in this figure (clearing its
+        first axes) instead of a new one, so one figure serves every page
+        """
+        columns = [ENTRIES_DISPLAY_NAMES[column]
+                   for column in self.retrieve("entries_dataframe")]
         colWidths = [.2, .16, .16, .16, .16, .16]
 
-        fig = plt.figure(figsize=self.PAGE_SIZE)
-        ax = fig.add_subplot(1, 1, 1)
+        if fig is None:
+            fig = Figure(figsize=self.PAGE_SIZE)
+        if fig.axes:
+            ax = fig.axes[0]
+            ax.clear()
+        else:
+            ax = fig.add_subplot(1, 1, 1)
 
         table = ax.table(cellText=data, colLabels=columns, loc="center",
                          fontsize=16, colWidths=colWidths)
@@ -471,34 +582,32 @@ class PDFReportCreator(ReportCreator):
         self.pdf.savefig(fig)
 
     def write_entries_dataframe(self):
-        """Plot the entries DataFrame"""
-        # start page: "entries in the last 15 days"
-        fig = plt.figure(figsize=self.PAGE_SIZE)
-        plt.subplot2grid((1, 1), (0, 0))
-        plt.text(0, 1, "Entries in the last 15 days", fontsize=34)
-        plt.axis("off")
+        """Plot the entries table"""
+        # start page: "entries in the last ENTRIES_DAYS days"
+        fig = Figure(figsize=self.PAGE_SIZE)
+        ax = fig.add_subplot(1, 1, 1)
+        ax.text(0, 1, f"Entries in the last {self.ENTRIES_DAYS} days",
+                fontsize=34)
+        ax.axis("off")
         self.pdf.savefig(fig)
 
-        # find index intervals corresponding to each day
-        entries_nparray = np.array(self.retrieve("entries_dataframe"))
-        if len(entries_nparray) == 0:
+        # find index intervals corresponding to each day: entries are sorted,
+        # so a day starts wherever the date part of the string changes
+        entries = self.retrieve("entries_dataframe")
+        if len(entries["date"]) == 0:
             return None
-        curr_start = 0
-        curr_date = entries_nparray[0][0].split(' ')[0]
-        intervals = []
-        for i in range(len(entries_nparray)):
-            new_date = entries_nparray[i][0].split(' ')[0]
-            if new_date != curr_date:
-                intervals.append((curr_start, i-1))
-                curr_date = new_date
-                curr_start = i
-        intervals.append((curr_start, len(entries_nparray)-1))
-        for a, b in intervals:
-            self.write_entries_table(entries_nparray[a:b+1])
+        # dates are formatted as dd/mm/yy HH:MM, so the day is the first 8
+        # characters
+        day = entries["date"].astype("U8")
+        starts = np.flatnonzero(day[1:] != day[:-1]) + 1
+        bounds = [0] + starts.tolist() + [len(day)]
+        rows = np.column_stack(list(entries.values()))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            self.write_entries_table(rows[a:b], fig=fig)
 
     def plot_tir_by_hour_graph(self):
         """plot a tir by hour line graph"""
-        fig = plt.figure(figsize=self.PAGE_SIZE)
+        fig = Figure(figsize=self.PAGE_SIZE)
         ax = fig.add_subplot(1, 1, 1)
 
         hour = np.array(range(24))
@@ -527,9 +636,8 @@ class PDFReportCreator(ReportCreator):
         ax.set_xlabel("Hour")
         ax.set_ylabel("Percentage (%)")
 
-        all_hours = list(range(1, 24)) + [0]
-        ax.set_xticks(all_hours)
-        ax.set_xticklabels(list(map(lambda h: f"{h:0=2d}", all_hours)))
+        ax.set_xticks(HOUR_TICKS)
+        ax.set_xticklabels(HOUR_LABELS)
 
         ax.set_yticks(list(map(lambda x: x/10, range(11))))
         ax.set_yticklabels(list(range(0, 110, 10)))
@@ -538,18 +646,18 @@ class PDFReportCreator(ReportCreator):
 
     def plot_lows_report(self):
         """plot a page with information on low blood sugars"""
-        fig = plt.figure(figsize=self.PAGE_SIZE)
-        plt.subplot2grid((2, 1), (0, 0))
+        fig = Figure(figsize=self.PAGE_SIZE)
+        ax = fig.add_subplot(2, 1, 1)
 
-        plt.text(0, 1, "Hypoglycemia-Related Statistics", ha="left", va="top",
-                 fontsize=28)
+        ax.text(0, 1, "Hypoglycemia-Related Statistics", ha="left", va="top",
+                fontsize=28)
         low_count = self.retrieve("low_bg_count")
         mean_daily_low_rate = self.retrieve("mean_daily_low_rate")
-        plt.text(
+        ax.text(
             0, 0.7,
             f"Hypoglycemia episodes: {low_count}",
             ha="left", va="top")
-        plt.text(
+        ax.text(
             0, 0.6,
             f"Mean daily hypoglycemia rate: {100*mean_daily_low_rate:.2f}%",
             ha="left", va="top")
@@ -557,21 +665,20 @@ class PDFReportCreator(ReportCreator):
         very_low_count = self.retrieve("very_low_bg_count")
         very_low_rate = 100*self.retrieve("very_low_bg_rate")
 
-        plt.text(
+        ax.text(
             0, 0.5,
             (f"Very low hypoglycemia episodes (below 55): {very_low_count}"
              + f" ({very_low_rate:.2f}% of all entries)"),
             ha="left", va="top"
         )
 
-        plt.axis("off")
+        ax.axis("off")
 
-        plt.text(.5, 0,
-                 "Hypoglycemia Distribution",
-                 ha="center", va="bottom", fontsize=16)
+        ax.text(.5, 0,
+                "Hypoglycemia Distribution",
+                ha="center", va="bottom", fontsize=16)
 
-        ax = plt.subplot2grid((2, 1), (1, 0), aspect="auto")
-        # ax = fig.add_subplot(1, 1, 1)
+        ax = fig.add_subplot(2, 1, 2, aspect="auto")
         distributions = self.retrieve("low_bg_distributions", {})
 
         labels = [f"{a}-{b}" for a, b in distributions]
@@ -590,31 +697,24 @@ class PDFReportCreator(ReportCreator):
         self.pdf.savefig(fig)
 
     def create_report(self, target: BinaryIO):
-        """Create PDF report to be saved in target file/buffer"""
-        self.pdf = backend_pdf.PdfPages(target)
-
-        for days in [15]:
-            self.save_hba1c()
-            self.GRAPH_DAYS = days
-            self.reset_df(self.GRAPH_DAYS)
-            self.save_tir()
-            self.save_entry_count()
-            self.save_fast_insulin_use()
-            self.save_mean_glucose_by_hour()
-            self.save_tir_by_hour()
-            self.save_low_counts()
-            self.save_mean_daily_low_rate()
-            self.save_very_low_count_and_rate()
-
-            self.write_statistics_page(show_hba1c=(days >= 90))
-            if days <= 30:
+        """Create PDF report to be saved in target file/buffer
+
+        The report is drawn from the values stored by fill_report, which is
+        only called here if the report is still empty. PDF_RC_PARAMS are only
+        applied while the report is drawn"""
+        if not self.report_as_dict:
+            self.fill_report()
+        # settings only apply while drawing, not to the rest of the program
+        with matplotlib.rc_context(PDF_RC_PARAMS):
+            self.pdf = backend_pdf.PdfPages(target)
+
+            self.write_statistics_page(show_hba1c=(self.GRAPH_DAYS >= 90))
+            if self.GRAPH_DAYS <= 30:
                 self.plot_glucose_by_hour_graph()
             self.plot_tir_by_hour_graph()
             self.plot_lows_report()
 
-        # Plot entries for the last 7 days
-        self.reset_df(7)
-        self.save_entries_df()
-        self.write_entries_dataframe()
+            # Plot entries for the last ENTRIES_DAYS days
+            self.write_entries_dataframe()
 
-        self.pdf.close()
+            self.pdf.close()
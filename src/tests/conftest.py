@@ -1,66 +1,65 @@
+import numpy as np
 import pandas as pd
 import pytest
 from io import BytesIO, StringIO
-from datetime import datetime, timedelta
-from random import randint, randrange
+from datetime import datetime
 from typing import BinaryIO, TextIO, List
 
 from glikoz import dataframe_handler
 
 
-@pytest.fixture(scope="function")
-def random_dataframe_handler():
-    """DataFrameHandler initialized with a random valid DataFrame"""
+@pytest.fixture(scope="session")
+def _random_df() -> pd.DataFrame:
+    """Random valid entry DataFrame, built once per test session"""
     number_of_samples = 4000
     datetime_strf = "%d/%m/%Y %H:%M"
     datetime_range = (datetime.strptime("01/01/2020 00:00", datetime_strf),
                       datetime.strptime("20/05/2023 23:59", datetime_strf))
-    delta = datetime_range[1] - datetime_range[0]
-    int_delta = (delta.days * 24 * 60 * 60) + delta.seconds
-
-    dates, glucose, bolus, correction, basal, activity = [], [], [], [], [], []
-    hba1c, meal, tags, comments, carbs = [], [], [], [], []
+    t0, t1 = (int(d.timestamp()) for d in datetime_range)
+
+    dates = pd.to_datetime(np.sort(np.random.randint(t0, t1,
+                                                     number_of_samples)),
+                           unit="s")
+    glucose = np.where(np.random.randint(0, 5, number_of_samples) < 3,
+                       np.nan,
+                       np.random.randint(40, 321, number_of_samples))
+    carbs = np.random.randint(0, 101, number_of_samples)
     possible_tags = [["a", "b"], ["a"], ["b"], []]
-    for _ in range(number_of_samples):
-        random_date = datetime_range[0] + timedelta(
-            seconds=randrange(int_delta))
-        dates.append(random_date)
-        glucose.append(None if randint(0, 4) < 3 else randint(40, 320))
-        bolus.append(randint(0, 10))
-        correction.append(randint(0, 10))
-        basal.append(randint(0, 30))
-        activity.append(randint(0, 100))
-        hba1c.append(randint(4, 8) + 0.1*randint(0, 10))
-        meal.append({"carbs": randint(0, 100)})
-        carbs.append(float(meal[-1]["carbs"]))
-        tags.append(possible_tags[randint(0, len(possible_tags)-1)])
-        comments.append("comment" if randint(0, 100) > 90 else "")
+    tags_idx = np.random.randint(0, len(possible_tags), number_of_samples)
+    comments = np.where(np.random.randint(0, 101, number_of_samples) > 90,
+                        "comment", "")
 
     df = pd.DataFrame({
             "date": dates,
             "glucose": glucose,
-            "bolus_insulin": bolus,
-            "correction_insulin": correction,
-            "basal_insulin": basal,
-            "activity": activity,
-            "hba1c": hba1c,
-            "meal": meal,
-            "tags": tags,
+            "bolus_insulin": np.random.randint(0, 11, number_of_samples),
+            "correction_insulin": np.random.randint(0, 11,
+                                                    number_of_samples),
+            "basal_insulin": np.random.randint(0, 31, number_of_samples),
+            "activity": np.random.randint(0, 101, number_of_samples),
+            "hba1c": (np.random.randint(4, 9, number_of_samples)
+                      + 0.1*np.random.randint(0, 11, number_of_samples)),
+            "tags": [list(possible_tags[i]) for i in tags_idx],
             "comments": comments,
-            "carbs": carbs
+            "carbs": carbs.astype(float)
         })
     df["fast_insulin"] = df["bolus_insulin"] + df["correction_insulin"]
     df["total_insulin"] = df["fast_insulin"] + df["basal_insulin"]
-    handler = dataframe_handler.DataFrameHandler(df)
 
-    return handler
+    return df
+
+
+@pytest.fixture(scope="function")
+def random_dataframe_handler(_random_df):
+    """DataFrameHandler initialized with a random valid DataFrame"""
+    return dataframe_handler.DataFrameHandler(_random_df.copy(deep=True))
 
 
 @pytest.fixture(scope="function")
 def empty_dataframe_handler() -> dataframe_handler.DataFrameHandler:
     df = pd.DataFrame(columns=[
         "date", "glucose", "bolus_insulin", "correction_insulin",
-        "basal_insulin", "activity", "hba1c", "meal", "tags", "comments",
+        "basal_insulin", "activity", "hba1c", "tags", "comments",
         "carbs", "fast_insulin", "total_insulin"
     ])
     handler = dataframe_handler.DataFrameHandler(df)
@@ -78,14 +77,9 @@ def textIO_buffer() -> TextIO:
     return StringIO()
 
 
-def random_date(start: datetime, end: datetime) -> datetime:
-    delta = end - start
-    int_delta = (delta.days * 24 * 60 * 60) + delta.seconds
-    return start + timedelta(seconds=randrange(int_delta))
-
-
 def random_entries(number_of_entries: int) -> List[List[str]]:
-    entries = []
+    n = number_of_entries
+    entries = [None] * (n + 1)
     base = []
     base.append('"meta";"23"')
     tags = ["tag1", "tag2", "tag3"]
@@ -94,56 +88,63 @@ def random_entries(number_of_entries: int) -> List[List[str]]:
     foods = {"food1": 5, "food2": 10, "food3": 0, "food5": 100}
     for food, glycemic_idx in foods.items():
         base.append(f'"food";"{food}";;"{food}";"{glycemic_idx}"')
-    entries.append(base)
+    entries[0] = base
+
     datetime_strf = "%Y-%m-%d %H:%M:%S"
     datetime_range = (datetime.strptime("2020-01-01 00:00:00", datetime_strf),
                       datetime.strptime("2023-05-20 23:59:59", datetime_strf))
-    for _ in range(number_of_entries):
-        current_entry = []
-        date = random_date(datetime_range[0], datetime_range[1])
-        date_formatted = date.strftime(datetime_strf)
-        current_entry.append(f'"entry";"{date_formatted}";""')
-        nothing_written: bool = True
-        glucose = randint(30, 330)
-        if randint(1, 100) < 70:
-            current_entry.append(f'"measurement";"bloodsugar";"{glucose:.1f}"')
-            nothing_written = False
-        ins = [randint(0, 10), randint(0, 10), randint(0, 30)]
-        for i in range(3):
-            ins[i] = f"{ins[i]:.1f}"
-        if randint(1, 100) < 80:
+    t0, t1 = (int(d.timestamp()) for d in datetime_range)
+    dates = pd.to_datetime(np.random.randint(t0, t1, n), unit="s"
+                           ).strftime(datetime_strf)
+
+    glucose = np.random.randint(30, 331, n)
+    has_glucose = np.random.randint(1, 101, n) < 70
+    insulin = np.column_stack([np.random.randint(0, 11, n),
+                               np.random.randint(0, 11, n),
+                               np.random.randint(0, 31, n)])
+    has_insulin = np.random.randint(1, 101, n) < 80
+    hba1c = np.random.randint(4, 17, n) / 2
+    has_hba1c = np.random.randint(1, 101, n) < 2
+    meal = np.random.randint(0, 101, n)
+    has_meal = np.random.randint(1, 101, n) < 50
+    food_weights = np.random.randint(10, 101, (n, len(foods)))
+    has_food = np.random.randint(1, 101, (n, len(foods))) < 40
+    has_tag = np.random.randint(1, 101, (n, len(tags))) < 10
+    activity = np.random.randint(0, 101, n)
+    has_activity = (np.random.randint(1, 101, n) < 10) | ~(
+        has_glucose | has_insulin | has_hba1c | has_meal
+        | has_food.any(axis=1) | has_tag.any(axis=1))
+
+    food_names = list(foods.keys())
+    for i in range(n):
+        current_entry = [f'"entry";"{dates[i]}";""']
+        if has_glucose[i]:
+            current_entry.append(
+                f'"measurement";"bloodsugar";"{glucose[i]:.1f}"')
+        if has_insulin[i]:
+            ins = insulin[i]
             current_entry.append(('"measurement";"insulin";'
-                                  + f'"{ins[0]}";"{ins[1]}";"{ins[2]}"'))
-            nothing_written = False
-        hba1c = randint(4, 16)/2
-        if randint(1, 100) < 2:
-            current_entry.append(f'"measurement";"hba1c";"{hba1c:.1f}"')
-            nothing_written = False
-        meal = float(randint(0, 100))
-        if randint(1, 100) < 50:
-            current_entry.append(f'"measurement";"meal";"{meal:.1f}"')
-            nothing_written = False
-        for food, glycemic_idx in foods.items():
-            if randint(1, 100) < 40:
-                weight = randint(10, 100)
-                current_entry.append(f'"foodEaten";"{food}";"{weight:.1f}"')
-                nothing_written = False
-        for tag in tags:
-            if randint(1, 100) < 10:
-                current_entry.append(f'"entryTag";"{tag}"')
-                nothing_written = False
-        activity = randint(0, 100)
-        if nothing_written or randint(1, 100) < 10:
-            current_entry.append(f'"measurement";"activity";"{activity:.1f}"')
-        entries.append(current_entry)
+                                  + f'"{ins[0]:.1f}";"{ins[1]:.1f}";'
+                                  + f'"{ins[2]:.1f}"'))
+        if has_hba1c[i]:
+            current_entry.append(f'"measurement";"hba1c";"{hba1c[i]:.1f}"')
+        if has_meal[i]:
+            current_entry.append(f'"measurement";"meal";"{meal[i]:.1f}"')
+        current_entry.extend(
+            f'"foodEaten";"{food_names[j]}";"{food_weights[i, j]:.1f}"'
+            for j in np.flatnonzero(has_food[i]))
+        current_entry.extend(f'"entryTag";"{tags[j]}"'
+                             for j in np.flatnonzero(has_tag[i]))
+        if has_activity[i]:
+            current_entry.append(
+                f'"measurement";"activity";"{activity[i]:.1f}"')
+        entries[i + 1] = current_entry
     return entries
 
 
 def StringIO_from_list_of_entries(entries: list) -> StringIO:
     target = StringIO()
-    for entry in entries:
-        for line in entry:
-            target.write(line + '\n')
+    target.writelines(line + '\n' for entry in entries for line in entry)
     target.seek(0)
     return target
 
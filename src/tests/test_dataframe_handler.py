@@ -1,12 +1,16 @@
+from io import StringIO
+
+import numpy as np
 import pandas as pd
+import pytest
 
-from glikoz.dataframe_handler import DiaguardCSVParser
+from glikoz.dataframe_handler import DiaguardCSVParser, DataFrameHandler
 
 
 class TestDiaguardCSVParser:
     expected_columns = {
         "date", "glucose", "bolus_insulin", "correction_insulin",
-        "basal_insulin", "activity", "hba1c", "meal", "tags",
+        "basal_insulin", "activity", "hba1c", "tags",
         "comments", "carbs", "fast_insulin", "total_insulin"
     }
 
@@ -49,6 +53,36 @@ class TestDiaguardCSVParser:
         assert set(df.columns) == self.expected_columns
         assert not df.empty
 
+    def test_csv_with_min_date_skips_older_entries(
+            self, valid_random_diaguard_csv_backup):
+        """Entries before min_date should not be in the DataFrame"""
+        min_date = "2022-01-01"
+        parser = DiaguardCSVParser()
+        df = parser.parse_csv(valid_random_diaguard_csv_backup,
+                              min_date=min_date)
+        valid_random_diaguard_csv_backup.seek(0)
+        full_df = DiaguardCSVParser().parse_csv(
+            valid_random_diaguard_csv_backup)
+        assert set(df.columns) == self.expected_columns
+        assert (df["date"] >= min_date).all()
+        assert len(df) == (full_df["date"] >= min_date).sum()
+
+    def test_csv_with_unpadded_min_date(self,
+                                        valid_random_diaguard_csv_backup):
+        df = DiaguardCSVParser().parse_csv(valid_random_diaguard_csv_backup,
+                                           min_date="2022-1-5")
+        assert (df["date"] >= "2022-01-05").all()
+        valid_random_diaguard_csv_backup.seek(0)
+        full_df = DiaguardCSVParser().parse_csv(
+            valid_random_diaguard_csv_backup)
+        assert len(df) == (full_df["date"] >= "2022-01-05").sum()
+
+    def test_csv_with_invalid_min_date(self,
+                                       valid_random_diaguard_csv_backup):
+        with pytest.raises(ValueError):
+            DiaguardCSVParser().parse_csv(valid_random_diaguard_csv_backup,
+                                          min_date="01/01/2022")
+
     def test_valid_csv_glucose_entry_count(self,
                                            valid_random_diaguard_csv_backup):
         """
@@ -61,6 +95,38 @@ class TestDiaguardCSVParser:
         bloodsugar_lines = buffer_value.count("bloodsugar")
         assert bloodsugar_lines == df["glucose"].count()
 
+    def test_valid_csv_keep_meal(self, valid_random_diaguard_csv_backup):
+        """The meal column should only be kept when requested, and its
+        carbohydrates should add up to the carbs column"""
+        parser = DiaguardCSVParser(keep_meal=True)
+        df = parser.parse_csv(valid_random_diaguard_csv_backup)
+        assert set(df.columns) == self.expected_columns | {"meal"}
+        meal_carbs = df["meal"].apply(lambda meal: sum(meal.values()))
+        assert (meal_carbs.astype("float32") == df["carbs"]).all()
+
+    def test_food_eaten_twice_in_entry_counts_last_line(self):
+        """A food repeated in an entry should only count its last line"""
+        csv = StringIO("\n".join([
+            '"food";"bread";;"bread";"50"',
+            '"entry";"2022-01-01 08:00:00";""',
+            '"measurement";"meal";"10.0"',
+            '"foodEaten";"bread";"100.0"',
+            '"foodEaten";"bread";"20.0"',
+        ]))
+        df = DiaguardCSVParser(keep_meal=True).parse_csv(csv)
+        assert df["meal"][0] == {"carbs": 10., "bread": 10.}
+        assert df["carbs"][0] == 20.
+
+    def test_valid_csv_derived_insulin_columns(
+            self, valid_random_diaguard_csv_backup):
+        """fast_insulin and total_insulin should be derived per entry from
+        the bolus, correction and basal columns"""
+        parser = DiaguardCSVParser()
+        df = parser.parse_csv(valid_random_diaguard_csv_backup)
+        fast_insulin = df["bolus_insulin"] + df["correction_insulin"]
+        assert df["fast_insulin"].equals(fast_insulin)
+        assert df["total_insulin"].equals(fast_insulin + df["basal_insulin"])
+
 
 class TestDataFrameHandler:
     def test_dataframe_versions_are_equal_in_unchanged_handler(
@@ -88,6 +154,110 @@ class TestDataFrameHandler:
         assert random_dataframe_handler.original_df.equals(
             random_dataframe_handler.df)
 
+    def test_modifying_df_after_reset_keeps_original_df(
+            self, random_dataframe_handler):
+        """Writes to a reset df should not reach original_df"""
+        original_glucose = random_dataframe_handler.original_df[
+            "glucose"].copy()
+        random_dataframe_handler.col_lims("glucose", 70, 180).reset_df()
+        random_dataframe_handler.df["glucose"] = 0
+        random_dataframe_handler.df.iloc[0, 1] = 1
+        assert random_dataframe_handler.original_df["glucose"].equals(
+            original_glucose)
+
+    def test_modifying_df_after_date_filter_keeps_original_df(
+            self, random_dataframe_handler):
+        """Writes to a df selected by a date filter should not reach
+        original_df"""
+        original_glucose = random_dataframe_handler.original_df[
+            "glucose"].copy()
+        random_dataframe_handler.last_x_days(30).df.iloc[0, 1] = 1
+        random_dataframe_handler.reset_df().date("2021-01-01", "2022-01-01")
+        random_dataframe_handler.df.iloc[0, 1] = 1
+        assert random_dataframe_handler.original_df["glucose"].equals(
+            original_glucose)
+
+    def test_date_selects_entries_in_interval(self,
+                                              random_dataframe_handler):
+        """Selected dates should be in [lower_bound, upper_bound)"""
+        random_dataframe_handler.date("2021-01-01", "2022-01-01")
+        date_series = random_dataframe_handler.df["date"]
+        original_dates = random_dataframe_handler.original_df["date"]
+        assert (date_series >= "2021-01-01").all()
+        assert (date_series < "2022-01-01").all()
+        assert len(date_series) == ((original_dates >= "2021-01-01")
+                                    & (original_dates < "2022-01-01")).sum()
+
+    def test_date_on_unsorted_dataframe(self, _random_df):
+        """Entries out of date order should be sorted before filtering"""
+        shuffled_df = _random_df.sample(frac=1, random_state=0)
+        handler = DataFrameHandler(shuffled_df)
+        handler.date("2021-01-01", "2022-01-01")
+        date_series = handler.df["date"]
+        assert date_series.is_monotonic_increasing
+        assert len(date_series) == ((shuffled_df["date"] >= "2021-01-01")
+                                    & (shuffled_df["date"] < "2022-01-01")
+                                    ).sum()
+
+    def test_date_filters_on_unsorted_df_set_by_user(
+            self, random_dataframe_handler, _random_df):
+        """Date filters should also work on an unsorted df set by the user"""
+        shuffled_df = _random_df.sample(frac=1, random_state=0)
+        random_dataframe_handler.df = shuffled_df
+        random_dataframe_handler.date("2021-01-01", "2022-01-01")
+        assert len(random_dataframe_handler.df) == (
+            (shuffled_df["date"] >= "2021-01-01")
+            & (shuffled_df["date"] < "2022-01-01")).sum()
+        random_dataframe_handler.df = shuffled_df
+        random_dataframe_handler.last_x_days(5)
+        cutoff = shuffled_df["date"].max().normalize() - pd.Timedelta(4, "d")
+        assert len(random_dataframe_handler.df) == (
+            shuffled_df["date"] >= cutoff).sum()
+
+    def test_date_filters_with_missing_dates(self, _random_df):
+        """Entries without a date should never be selected by date"""
+        df = _random_df.copy()
+        df.loc[df.index[-10:], "date"] = pd.NaT
+        handler = DataFrameHandler(df)
+        handler.last_x_days(30)
+        cutoff = df["date"].max().normalize() - pd.Timedelta(29, "d")
+        assert len(handler.df) == (df["date"] >= cutoff).sum()
+        handler.reset_df().date("2021-01-01", "2022-01-01")
+        assert len(handler.df) == ((df["date"] >= "2021-01-01")
+                                   & (df["date"] < "2022-01-01")).sum()
+
+    def test_glucose_is_stored_as_float32(self, _random_df):
+        """Glucose readings should be float32 without changing the input"""
+        df = _random_df.copy()
+        df["glucose"] = df["glucose"].astype("float64")
+        handler = DataFrameHandler(df)
+        assert handler.df["glucose"].dtype == "float32"
+        assert df["glucose"].dtype == "float64"
+        assert handler.df["glucose"].equals(df["glucose"].astype("float32"))
+
+    def test_groupby_hour_has_every_hour(self, random_dataframe_handler):
+        """Hours without entries should still be groups"""
+        random_dataframe_handler.date("2021-01-01 10:00", "2021-01-01 12:00")
+        glucose_count = random_dataframe_handler.groupby_hour()[
+            "glucose"].count()
+        assert glucose_count.index.tolist() == list(range(24))
+        assert glucose_count.sum() == random_dataframe_handler.df[
+            "glucose"].count()
+
+    def test_groupby_with_duplicate_index_labels(self, _random_df):
+        """Concatenated backups (with repeated index labels) can be grouped"""
+        df = pd.concat([_random_df, _random_df])
+        handler = DataFrameHandler(df)
+        day_count = handler.last_x_days(400).groupby_day()["glucose"].count()
+        filtered_df = handler.view()
+        assert day_count.sum() == filtered_df["glucose"].count()
+        assert day_count.equals(filtered_df.groupby(
+            filtered_df["date"].dt.normalize())["glucose"].count())
+        hour_count = handler.col_lims("glucose", 70, 180).groupby_hour()[
+            "glucose"].count()
+        assert hour_count.to_numpy().tolist() == np.bincount(
+            handler.view()["date"].dt.hour, minlength=24).tolist()
+
     def test_col_lims_with_empty_result(self, random_dataframe_handler):
         """When no rows fit the filter, the resulting df should be empty"""
         column = "glucose"
@@ -97,6 +267,13 @@ class TestDataFrameHandler:
             upper_bound=max_value_in_column+2)
         assert random_dataframe_handler.df.empty
 
+    def test_col_lims_covering_every_value_keeps_all_rows(
+            self, random_dataframe_handler):
+        """Bounds wider than the column's range should select every row"""
+        random_dataframe_handler.col_lims(column="bolus_insulin")
+        assert random_dataframe_handler.df.equals(
+            random_dataframe_handler.original_df)
+
     def test_col_lims_with_bound_interval_empty(self,
                                                 random_dataframe_handler):
         """
@@ -130,3 +307,34 @@ class TestDataFrameHandler:
         date_series = random_dataframe_handler.df["date"]
         date_delta = date_series.max() - date_series.min()
         assert date_delta.days <= x
+
+    def test_has_tags(self, random_dataframe_handler):
+        """has_tags and its inverse should split entries by tag presence"""
+        total = random_dataframe_handler.count()
+        with_tags = random_dataframe_handler.has_tags().df["tags"]
+        without_tags = random_dataframe_handler.reset_df().has_tags(
+            invert_filter=True).df["tags"]
+        assert all(len(t) > 0 for t in with_tags)
+        assert all(len(t) == 0 for t in without_tags)
+        assert len(with_tags) + len(without_tags) == total
+
+    def test_has_comments(self, random_dataframe_handler):
+        """Every selected entry should have a non-empty comment"""
+        random_dataframe_handler.has_comments()
+        comments = random_dataframe_handler.df["comments"]
+        assert not comments.empty
+        assert (comments != "").all()
+
+    def test_tags_include_all_tags(self, random_dataframe_handler):
+        """Every selected entry should have all of the given tags"""
+        random_dataframe_handler.tags_include(["a", "b"])
+        tags = random_dataframe_handler.df["tags"]
+        assert not tags.empty
+        assert all("a" in t and "b" in t for t in tags)
+
+    def test_tags_include_any_tag(self, random_dataframe_handler):
+        """Every selected entry should have at least one of the given tags"""
+        expected = sum(1 for t in random_dataframe_handler.df["tags"]
+                       if "a" in t or "b" in t)
+        random_dataframe_handler.tags_include(["a", "b"], include_any=True)
+        assert random_dataframe_handler.count() == expected
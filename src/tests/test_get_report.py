@@ -0,0 +1,75 @@
+import os
+from io import StringIO
+
+import pandas as pd
+import pytest
+
+import get_report
+from glikoz.dataframe_handler import DiaguardCSVParser
+from .conftest import StringIO_from_list_of_entries, random_entries
+
+
+class UnseekableStringIO(StringIO):
+    """Text stream that cannot be rewound, like a pipe"""
+
+    def seekable(self):
+        return False
+
+
+@pytest.fixture(scope="function")
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_report, "CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+class TestParseCSV:
+    def test_cache_hit_skips_parser(self, cache_dir, monkeypatch,
+                                    valid_random_diaguard_csv_backup):
+        content = valid_random_diaguard_csv_backup.getvalue()
+        df = get_report.parse_csv(StringIO(content), use_cache=True)
+        assert len(list(cache_dir.glob("*.pkl"))) == 1
+
+        def parse_csv(*args, **kwargs):
+            raise AssertionError("cached backup was parsed again")
+        monkeypatch.setattr(DiaguardCSVParser, "parse_csv", parse_csv)
+        cached_df = get_report.parse_csv(StringIO(content), use_cache=True)
+        pd.testing.assert_frame_equal(cached_df, df)
+
+    def test_corrupt_cache_file_is_replaced(
+            self, cache_dir, valid_random_diaguard_csv_backup):
+        content = valid_random_diaguard_csv_backup.getvalue()
+        df = get_report.parse_csv(StringIO(content), use_cache=True)
+        cache_path, = cache_dir.glob("*.pkl")
+        cache_path.write_bytes(cache_path.read_bytes()[:100])
+        reparsed_df = get_report.parse_csv(StringIO(content), use_cache=True)
+        pd.testing.assert_frame_equal(reparsed_df, df)
+        pd.testing.assert_frame_equal(pd.read_pickle(cache_path), df)
+
+    def test_cache_keeps_cache_size_files(self, cache_dir, monkeypatch):
+        monkeypatch.setattr(get_report, "CACHE_SIZE", 2)
+        for _ in range(4):
+            csv = StringIO_from_list_of_entries(random_entries(5))
+            get_report.parse_csv(csv, use_cache=True)
+        assert len(list(cache_dir.glob("*.pkl"))) == 2
+
+    def test_unseekable_csv_is_cached(self, cache_dir,
+                                      valid_random_diaguard_csv_backup):
+        content = valid_random_diaguard_csv_backup.getvalue()
+        df = get_report.parse_csv(UnseekableStringIO(content),
+                                  use_cache=True)
+        expected_df = DiaguardCSVParser().parse_csv(StringIO(content))
+        pd.testing.assert_frame_equal(df, expected_df)
+        assert len(list(cache_dir.glob("*.pkl"))) == 1
+
+    def test_cache_key_depends_on_min_date(
+            self, valid_random_diaguard_csv_backup):
+        content = valid_random_diaguard_csv_backup.getvalue()
+        assert (get_report.cache_key(StringIO(content))
+                != get_report.cache_key(StringIO(content), "2022-01-01"))
+        assert (get_report.cache_key(StringIO(content))
+                == get_report.cache_key(StringIO(content)))
+
+    def test_without_cache_nothing_is_written(
+            self, cache_dir, valid_random_diaguard_csv_backup):
+        get_report.parse_csv(valid_random_diaguard_csv_backup)
+        assert not os.listdir(cache_dir)
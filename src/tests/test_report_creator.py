@@ -1,7 +1,10 @@
+import matplotlib
 import numpy as np
 import pandas as pd
+from glikoz.dataframe_handler import DataFrameHandler
 from glikoz.report_creator import (ReportCreator, PDFReportCreator,
-                                   JSONReportCreator)
+                                   JSONReportCreator, RawReportCreator,
+                                   ENTRIES_DISPLAY_NAMES)
 
 
 class TestReportCreator:
@@ -19,6 +22,40 @@ class TestReportCreator:
         report_creator.save_hba1c()
         assert report_creator.retrieve("hba1c") == (160+46.7)/28.7
 
+    @staticmethod
+    def expected_hba1c(df):
+        cutoff = df["date"].max().normalize() - pd.Timedelta(89, "d")
+        glucose = df.loc[df["date"] >= cutoff, "glucose"]
+        return (glucose.mean()+46.7)/28.7
+
+    def test_save_hba1c_with_missing_dates(self, _random_df):
+        df = _random_df.copy()
+        df.loc[df.index[-10:], "date"] = pd.NaT
+        report_creator = ReportCreator(DataFrameHandler(df))
+        report_creator.fill_report()
+        assert np.isclose(report_creator.retrieve("hba1c"),
+                          self.expected_hba1c(df))
+
+    def test_save_hba1c_on_unsorted_df_set_by_user(
+            self, random_dataframe_handler, _random_df):
+        shuffled_df = _random_df.sample(frac=1, random_state=0)
+        random_dataframe_handler.df = shuffled_df
+        report_creator = ReportCreator(random_dataframe_handler)
+        report_creator.save_hba1c()
+        assert np.isclose(report_creator.retrieve("hba1c"),
+                          self.expected_hba1c(shuffled_df))
+
+    def test_mean_daily_low_rate_with_missing_dates(self, _random_df):
+        df = _random_df.copy()
+        df.loc[df.index[:10], "date"] = pd.NaT
+        report_creator = ReportCreator(DataFrameHandler(df))
+        report_creator.save_mean_daily_low_rate()
+        dated = df.dropna(subset=["date"])
+        daily_low_rate = dated.groupby(dated["date"].dt.normalize())[
+            "glucose"].agg(lambda g: (g < 70).sum()/max(g.count(), 1))
+        assert np.isclose(report_creator.retrieve("mean_daily_low_rate"),
+                          daily_low_rate.mean())
+
     def test_save_tir(self, random_dataframe_handler):
         sequence_size = len(random_dataframe_handler.df["glucose"])
         new_sequence = ([200]
@@ -47,6 +84,18 @@ class TestReportCreator:
         assert time_above_range == 0
         assert time_below_range == 0
 
+    def test_save_low_counts(self, random_dataframe_handler):
+        sequence_size = len(random_dataframe_handler.df["glucose"])
+        new_sequence = ([20, 30, 31, 55, 69, 70, 150]
+                        + [None]*(sequence_size-7))
+        random_dataframe_handler.df["glucose"] = pd.Series(new_sequence)
+        report_creator = ReportCreator(random_dataframe_handler)
+        report_creator.save_low_counts(threshold=70)
+        distributions = report_creator.retrieve("low_bg_distributions")
+        assert report_creator.retrieve("low_bg_count") == 5
+        assert distributions == {(20, 30): 2, (31, 40): 1, (41, 50): 0,
+                                 (51, 60): 1, (61, 69): 1}
+
     def test_total_entry_count_is_numeric(self, random_dataframe_handler):
         report_creator = ReportCreator(random_dataframe_handler)
         report_creator.save_entry_count()
@@ -120,6 +169,16 @@ class TestReportCreator:
         for series in series_dict.values():
             assert np.issubdtype(series.dtype, np.number)
 
+    def test_save_mean_glucose_by_hour_matches_groupby_hour(
+            self, random_dataframe_handler):
+        report_creator = ReportCreator(random_dataframe_handler)
+        report_creator.save_mean_glucose_by_hour()
+        series_dict = report_creator.retrieve("glucose_by_hour_series")
+        mean_glucose = random_dataframe_handler.groupby_hour()[
+            "glucose"].mean().dropna()
+        assert series_dict["hour"].tolist() == mean_glucose.index.tolist()
+        assert np.allclose(series_dict["mean_glucose"], mean_glucose)
+
     def test_mean_glucose_by_hour_series_are_empty_on_empty_dataframe_handler(
             self, empty_dataframe_handler):
         report_creator = ReportCreator(empty_dataframe_handler)
@@ -133,6 +192,15 @@ class TestReportCreator:
         report_creator = ReportCreator(random_dataframe_handler)
         report_creator.fill_report()
 
+    def test_fill_report_does_not_copy_dataframe(
+            self, random_dataframe_handler):
+        """Reports only read the DataFrame, so filtered slices stay views"""
+        report_creator = ReportCreator(random_dataframe_handler)
+        report_creator.fill_report()
+        assert np.shares_memory(
+            random_dataframe_handler.view()["glucose"].to_numpy(),
+            random_dataframe_handler.original_df["glucose"].to_numpy())
+
     def test_fill_report_on_empty_dataframe_handler(self,
                                                     empty_dataframe_handler):
         report_creator = ReportCreator(empty_dataframe_handler)
@@ -254,6 +322,33 @@ class TestJSONReportCreator:
         report_creator.create_report(target=textIO_buffer)
         assert len(textIO_buffer.getvalue()) > 0
 
+    def test_create_report_without_fill_report(
+            self, random_dataframe_handler, textIO_buffer):
+        report_creator = JSONReportCreator(random_dataframe_handler)
+        report_creator.create_report(target=textIO_buffer)
+        assert "hba1c" in textIO_buffer.getvalue()
+
+
+class TestRawReportCreator:
+    def test_create_report_with_random_dataframe_handler(
+            self, random_dataframe_handler, textIO_buffer):
+        report_creator = RawReportCreator(random_dataframe_handler)
+        report_creator.fill_report()
+        report_creator.create_report(target=textIO_buffer)
+        entries = report_creator.retrieve("entries_dataframe")
+        lines = textIO_buffer.getvalue().splitlines()
+        assert lines[-len(entries["date"])-1] == "\t".join(
+            ENTRIES_DISPLAY_NAMES[column] for column in entries)
+        assert lines[-1] == "\t".join(
+            column[-1] for column in entries.values())
+
+    def test_create_report_with_empty_dataframe_handler(
+            self, empty_dataframe_handler, textIO_buffer):
+        report_creator = RawReportCreator(empty_dataframe_handler)
+        report_creator.fill_report()
+        report_creator.create_report(target=textIO_buffer)
+        assert len(textIO_buffer.getvalue()) > 0
+
 
 class TestPDFReportCreator:
     def test_create_report_with_random_dataframe_handler(
@@ -269,3 +364,11 @@ class TestPDFReportCreator:
         report_creator.fill_report()
         report_creator.create_report(target=binaryIO_buffer)
         assert len(binaryIO_buffer.getbuffer()) > 0
+
+    def test_create_report_keeps_global_matplotlib_settings(
+            self, random_dataframe_handler, binaryIO_buffer):
+        rc_params = dict(matplotlib.rcParams)
+        report_creator = PDFReportCreator(random_dataframe_handler)
+        report_creator.fill_report()
+        report_creator.create_report(target=binaryIO_buffer)
+        assert dict(matplotlib.rcParams) == rc_params